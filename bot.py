@@ -4,14 +4,20 @@ Listens for messages in a single Slack channel (via Socket Mode) and
 forwards them to all configured Telegram groups.
 """
 
+import asyncio
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import time
 
 import httpx
+import orjson
 from dotenv import load_dotenv
-from slack_bolt import App
-from slack_bolt.adapter.socket_mode import SocketModeHandler
+from slack_bolt.adapter.socket_mode.aiohttp import AsyncSocketModeHandler
+from slack_bolt.async_app import AsyncApp
 
 from formatting import blocks_to_telegram_html, slack_mrkdwn_to_telegram_html
 
@@ -32,11 +38,21 @@ TELEGRAM_GROUP_IDS = [
 
 TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
 TELEGRAM_MAX_LENGTH = 4096
-
+SEND_QUEUE_SIZE = 1024
+MAX_SEND_ATTEMPTS = 5
+SHUTDOWN_DRAIN_TIMEOUT = 30
+
+# Log records are queued and written by a listener thread, so log I/O never
+# blocks the event loop.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[logging.handlers.QueueHandler(_log_queue)],
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 log = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -60,7 +76,26 @@ if _missing:
 # ---------------------------------------------------------------------------
 # Telegram helpers
 # ---------------------------------------------------------------------------
-http = httpx.Client(timeout=15)
+# Pool sized so every group can have a request in flight even if Telegram
+# falls back to HTTP/1.1; with HTTP/2 they share one multiplexed connection.
+http = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(15.0, pool=30.0),
+    limits=httpx.Limits(
+        max_connections=max(32, len(TELEGRAM_GROUP_IDS) * 2),
+        max_keepalive_connections=max(16, len(TELEGRAM_GROUP_IDS)),
+    ),
+)
+
+# One bounded queue per group, each drained by its own chat_sender task
+send_queues: dict[str, asyncio.Queue[str]] = {
+    chat_id: asyncio.Queue(maxsize=SEND_QUEUE_SIZE) for chat_id in TELEGRAM_GROUP_IDS
+}
+
+_SEND_URL = f"{TELEGRAM_API}/sendMessage"
+_HTML_PAYLOAD = {"parse_mode": "HTML", "disable_web_page_preview": True}
+# chat_id → time.monotonic() before which Telegram asked us not to send
+_next_ok_at: dict[str, float] = {}
 
 
 def split_message(text: str) -> list[str]:
@@ -73,49 +108,105 @@ def split_message(text: str) -> list[str]:
         return [text]
 
     chunks: list[str] = []
-    while text:
-        if len(text) <= TELEGRAM_MAX_LENGTH:
-            chunks.append(text)
-            break
+    pos = 0
+    n = len(text)
+    has_paragraphs = "\n\n" in text
+    while n - pos > TELEGRAM_MAX_LENGTH:
+        window_end = pos + TELEGRAM_MAX_LENGTH
 
         # Try to split at a paragraph boundary
-        cut = text.rfind("\n\n", 0, TELEGRAM_MAX_LENGTH)
-        if cut == -1:
-            cut = text.rfind("\n", 0, TELEGRAM_MAX_LENGTH)
-        if cut == -1:
-            cut = TELEGRAM_MAX_LENGTH
+        cut = text.rfind("\n\n", pos, window_end) if has_paragraphs else -1
+        if cut <= pos:
+            cut = text.rfind("\n", pos, window_end)
+        if cut <= pos:
+            cut = window_end
+
+        chunks.append(text[pos:cut])
+        pos = cut
+        while pos < n and text[pos] == "\n":
+            pos += 1
+
+    if pos < n:
+        chunks.append(text[pos:])
+    return chunks
 
-        chunks.append(text[:cut])
-        text = text[cut:].lstrip("\n")
 
-    return chunks
+def _response_error(resp: httpx.Response) -> dict | None:
+    """Return the decoded body of a failed Telegram API response, else None."""
+    # Telegram serializes "ok" first, so success needs no JSON decoding
+    if resp.content.startswith(b'{"ok":true'):
+        return None
+    data = orjson.loads(resp.content)
+    return None if data.get("ok") else data
+
 
+async def _send_message(chat_id: str, payload: dict) -> dict | None:
+    """POST sendMessage, waiting out Telegram rate limits (HTTP 429).
+
+    Honors retry_after and remembers it per chat so later sends to a
+    throttled chat wait instead of being rejected. Only runs inside that
+    chat's own chat_sender task, so the wait never delays other groups.
+    Returns the error body if the send ultimately failed, else None.
+    """
+    for _ in range(MAX_SEND_ATTEMPTS):
+        delay = _next_ok_at.get(chat_id, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
 
-def send_telegram_html(chat_id: str, html_text: str):
-    """Send pre-formatted HTML to a Telegram chat, splitting if too long."""
+        error = _response_error(await http.post(_SEND_URL, json=payload))
+        retry_after = error and error.get("parameters", {}).get("retry_after")
+        if not retry_after:
+            return error
+
+        log.warning("Rate limited on chat %s, retrying in %ss", chat_id, retry_after)
+        _next_ok_at[chat_id] = time.monotonic() + retry_after
+    return error
+
+
+async def send_telegram_html(chat_id: str, html_text: str):
+    """Send pre-formatted HTML to a Telegram chat, splitting if too long.
+
+    Raises RuntimeError if a chunk could not be delivered (rate limit
+    retries exhausted, or the plain-text fallback also failed).
+    """
     chunks = split_message(html_text)
 
     for chunk in chunks:
-        payload = {
-            "chat_id": chat_id,
-            "text": chunk,
-            "parse_mode": "HTML",
-            "disable_web_page_preview": True,
-        }
-        resp = http.post(f"{TELEGRAM_API}/sendMessage", json=payload)
-
-        if not resp.json().get("ok"):
+        payload = {**_HTML_PAYLOAD, "chat_id": chat_id, "text": chunk}
+        error = await _send_message(chat_id, payload)
+
+        if error and error.get("error_code") != 429:
             # Fall back to plain text if HTML parsing failed
             log.warning(
                 "HTML send failed for chat %s, retrying as plain text: %s",
                 chat_id,
-                resp.text,
+                error,
             )
             fallback = {
                 "chat_id": chat_id,
                 "text": chunk,
             }
-            http.post(f"{TELEGRAM_API}/sendMessage", json=fallback)
+            error = await _send_message(chat_id, fallback)
+
+        if error:
+            raise RuntimeError(f"Telegram rejected message for chat {chat_id}: {error}")
+
+
+async def chat_sender(chat_id: str, send_queue: asyncio.Queue[str]):
+    """Send one chat's queued messages in order, forever.
+
+    Each chat has its own queue and sender task, so a slow or throttled
+    group only delays its own messages, never other groups'.
+    """
+    while True:
+        html_text = await send_queue.get()
+        try:
+            await send_telegram_html(chat_id, html_text)
+            log.info("  ✓ Sent to %s", chat_id)
+        except Exception:
+            log.exception("  ✗ Failed to send to %s", chat_id)
+        finally:
+            send_queue.task_done()
 
 
 def extract_message_html(event: dict) -> str:
@@ -140,24 +231,25 @@ def extract_message_html(event: dict) -> str:
 # ---------------------------------------------------------------------------
 # Slack app
 # ---------------------------------------------------------------------------
-app = App(token=SLACK_BOT_TOKEN)
+app = AsyncApp(token=SLACK_BOT_TOKEN)
 
 
 @app.event("message")
-def handle_message(event: dict, say):
+async def handle_message(event: dict, say):
     # Only process messages from the target channel
     if event.get("channel") != SLACK_CHANNEL_ID:
         return
 
-    # Only forward Thena campaign messages
-    metadata = event.get("metadata", {})
-    event_type = metadata.get("event_type", "")
+    # Only forward Thena campaign messages (most messages carry no metadata)
+    metadata = event.get("metadata")
+    event_type = metadata.get("event_type", "") if metadata else ""
     if not event_type.startswith("MARKETING_CAMPAIGN"):
-        log.info(
-            "Skipping non-campaign message (event_type=%s, ts=%s)",
-            event_type or "none",
-            event.get("ts"),
-        )
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "Skipping non-campaign message (event_type=%s, ts=%s)",
+                event_type or "none",
+                event.get("ts"),
+            )
         return
 
     html_text = extract_message_html(event)
@@ -165,22 +257,47 @@ def handle_message(event: dict, say):
         log.info("Skipping message with no content (ts=%s)", event.get("ts"))
         return
 
-    log.info("Forwarding message to %d Telegram group(s)", len(TELEGRAM_GROUP_IDS))
+    log.info("Queueing message for %d Telegram group(s)", len(TELEGRAM_GROUP_IDS))
 
-    for chat_id in TELEGRAM_GROUP_IDS:
-        try:
-            send_telegram_html(chat_id, html_text)
-            log.info("  ✓ Sent to %s", chat_id)
-        except Exception:
-            log.exception("  ✗ Failed to send to %s", chat_id)
+    # Returns immediately unless a group's queue is full, in which case this
+    # waits for that group's sender to make room (other groups still get it)
+    await asyncio.gather(*(q.put(html_text) for q in send_queues.values()))
 
 
 # ---------------------------------------------------------------------------
 # Entrypoint
 # ---------------------------------------------------------------------------
+async def main():
+    """Run the Slack handler and the Telegram senders on one event loop."""
+    senders = [
+        asyncio.create_task(chat_sender(chat_id, q))
+        for chat_id, q in send_queues.items()
+    ]
+    try:
+        await AsyncSocketModeHandler(app, SLACK_APP_TOKEN).start_async()
+    finally:
+        # Events are acked before delivery, so give queued sends a bounded
+        # chance to finish instead of dropping them silently
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in send_queues.values())),
+                timeout=SHUTDOWN_DRAIN_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            for chat_id, q in send_queues.items():
+                if q.qsize():
+                    log.warning(
+                        "Shutting down with %d message(s) still queued for chat %s",
+                        q.qsize(),
+                        chat_id,
+                    )
+        for sender in senders:
+            sender.cancel()
+        await http.aclose()
+
+
 if __name__ == "__main__":
     log.info("Starting Slack → Telegram forwarder…")
     log.info("Monitoring channel: %s", SLACK_CHANNEL_ID)
     log.info("Forwarding to %d Telegram group(s): %s", len(TELEGRAM_GROUP_IDS), TELEGRAM_GROUP_IDS)
-    handler = SocketModeHandler(app, SLACK_APP_TOKEN)
-    handler.start()
+    asyncio.run(main())